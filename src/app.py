@@ -11,28 +11,64 @@ This is the main Flask web application file. It defines the web routes
 and renders the HTML templates to display to the user.
 '''
 # --- Imports ---
-from flask import Flask, render_template, request, redirect, url_for, session, flash # Core Flask components.
+from flask import Flask, render_template, stream_template, make_response, request, redirect, url_for, session, flash, get_flashed_messages, g # Core Flask components.
+import config # Loads the .env file once for the whole process.
 import backend # Direct import of our backend logic file.
 import os # Used for the secret key.
-from dotenv import find_dotenv, load_dotenv # Used to load environment variables.
-import bcrypt 
+import sys # Used to stop the app when configuration is missing.
+import itertools # Used to put back the first streamed search row.
+import hashlib # Used to build ETags for cacheable pages.
+from flask_session import Session # Server-side session storage.
+from flask_caching import Cache # Shared cache for rarely-changing query results.
+import redis # Backing store for server-side sessions.
 
 # --- App Initialization ---
 
-# Find and load the .env file from the root directory
-load_dotenv(find_dotenv())
-
 app = Flask(__name__)
-# Create a secret key for session management.
-app.secret_key = os.urandom(24)
+# Secret key for session management. Read it from the environment so every
+# worker signs sessions with the same key and they survive restarts; fall back
+# to a random key only for local development.
+app.secret_key = os.getenv("FLASK_SECRET_KEY")
+if not app.secret_key:
+    if os.environ.get("FLASK_ENV") == "production":
+        sys.exit(
+            "FATAL ERROR: FLASK_SECRET_KEY is not set.\n"
+            "Generate one with: python -c 'import secrets; print(secrets.token_hex(32))' and add it to your .env file."
+        )
+    app.secret_key = os.urandom(24)
+
+# When a Redis URL is configured, keep session data server-side so each request
+# only carries a session id instead of re-verifying a signed cookie payload.
+if os.getenv("SESSION_REDIS_URL"):
+    app.config['SESSION_TYPE'] = 'redis'
+    app.config['SESSION_REDIS'] = redis.from_url(os.getenv("SESSION_REDIS_URL"))
+    Session(app)
+
+# Cache for per-user query results (e.g. collection lists). Backed by Redis when
+# CACHE_REDIS_URL is set, so every worker process shares it; otherwise an
+# in-process cache is used.
+if os.getenv("CACHE_REDIS_URL"):
+    cache = Cache(app, config={'CACHE_TYPE': 'RedisCache', 'CACHE_REDIS_URL': os.getenv("CACHE_REDIS_URL")})
+else:
+    cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache'})
+
+# In production the templates never change on disk, so skip the per-request
+# mtime check and keep every compiled template in memory.
+if os.environ.get("FLASK_ENV") == "production":
+    app.config['TEMPLATES_AUTO_RELOAD'] = False
+    app.jinja_env.auto_reload = False
+    app.jinja_env.cache = {}
 
 # --- Prerequisite Check ---
 
 # Check for credentials before starting
-if not all([os.getenv("CS_USERNAME"), os.getenv("CS_PASSWORD"), os.getenv("DB_NAME")]):
-    print("FATAL ERROR: Missing database credentials in .env file.")
-    print("Please create a .env file in the project root with CS_USERNAME, CS_PASSWORD, and DB_NAME.")
-    exit()
+REQUIRED_ENV_VARS = ("CS_USERNAME", "CS_PASSWORD", "DB_NAME")
+missing_env_vars = [name for name in REQUIRED_ENV_VARS if not getattr(config, name)]
+if missing_env_vars:
+    sys.exit(
+        f"FATAL ERROR: Missing database credentials in .env file: {', '.join(missing_env_vars)}.\n"
+        "Please create a .env file in the project root with CS_USERNAME, CS_PASSWORD, and DB_NAME."
+    )
 
 # --- Helper Function ---
 
@@ -45,6 +81,88 @@ def is_logged_in():
     """
     return 'user_id' in session
 
+# How long (in seconds) a user's collection list may be reused across requests.
+# A write only invalidates the cache it can reach: with Redis that is every
+# worker's, but the in-process fallback is per worker, so other workers may
+# serve a stale list until it expires. Keep that window short.
+COLLECTIONS_CACHE_TTL = 300 if os.getenv("CACHE_REDIS_URL") else 30
+
+def _collections_cache_key(user_id):
+    """Builds the cache key for a user's collection list."""
+    return f"collections:{user_id}"
+
+def get_user_collections_cached(user_id):
+    """
+    Gets a user's collections, querying the database at most once per request
+    (via flask.g) and otherwise serving them from the shared cache until they
+    change or COLLECTIONS_CACHE_TTL seconds pass.
+
+    Returns:
+        The list of collections as returned by backend.get_user_collections.
+    """
+    if 'user_collections' not in g:
+        collections = cache.get(_collections_cache_key(user_id))
+        if collections is None:
+            collections = backend.get_user_collections(user_id)
+            cache.set(_collections_cache_key(user_id), collections, timeout=COLLECTIONS_CACHE_TTL)
+        g.user_collections = collections
+    return g.user_collections
+
+def redirect_back(fallback_endpoint):
+    """
+    Redirects to the page named by the form's hidden 'next' field.
+    Only local paths are accepted, so the field can't be used as an open redirect.
+
+    Returns:
+        A 303 redirect to 'next', or to fallback_endpoint if it is missing or unsafe.
+    """
+    next_url = request.form.get('next', '')
+    if next_url.startswith('/') and not next_url.startswith(('//', '/\\')):
+        return redirect(next_url, code=303)
+    return redirect(url_for(fallback_endpoint), code=303)
+
+def stream_page(template_name, **context):
+    """
+    Renders a template as a stream, for pages whose rows come straight from a
+    database cursor. Flash messages are taken out of the session up front: the
+    session is saved before a streamed body is rendered, so a flash popped
+    mid-stream would otherwise be shown again on the next page.
+    """
+    get_flashed_messages(with_categories=True)
+    return stream_template(template_name, **context)
+
+def has_pending_flashes():
+    """
+    Checks if flash messages are waiting to be shown. Pages carrying a flash
+    must be rendered fresh, so they are never served from an HTTP cache.
+    """
+    return '_flashes' in session
+
+# Endpoints that can be reached without logging in.
+PUBLIC_ENDPOINTS = {'login', 'register', 'logout', 'static'}
+
+@app.before_request
+def require_login():
+    """
+    Runs before every view. Sends anonymous users to the login page, and keeps
+    the logged-in user's id in g.user_id for the views to use.
+    """
+    if request.endpoint in PUBLIC_ENDPOINTS:
+        return None
+    if not is_logged_in():
+        # 303 so a POST to a protected route turns into a GET of the login page
+        return redirect(url_for('login'), code=303 if request.method == 'POST' else 302)
+    g.user_id = session['user_id']
+    return None
+
+def invalidate_user_collections(user_id):
+    """
+    Drops the cached collection list for a user. Call after any change to the
+    user's collections or to the songs inside them.
+    """
+    cache.delete(_collections_cache_key(user_id))
+    g.pop('user_collections', None)
+
 # --- User Account Routes ---
 
 @app.route('/', methods=['GET', 'POST'])
@@ -59,17 +177,19 @@ def login():
 
     if request.method == 'POST':
         # Pass login credentials to the backend
-        username = request.form['username']
-        password = request.form['password']
+        username = request.form.get('username')
+        password = request.form.get('password')
+        if not username or not password:
+            return 'Bad request', 400
 
-        print(f"Login attempt - Username: {username}, Password: {password}")
+        app.logger.debug("Login attempt - Username: %s", username)
 
         user = backend.login_user(username, password)
         if user:
             session['user_id'] = user['userid']
             session['username'] = user['username']
             flash('Login successful!', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('dashboard'), code=303)
         else:
             flash('Invalid username or password.', 'danger')
             
@@ -86,20 +206,23 @@ def register():
         return redirect(url_for('dashboard'))
 
     if request.method == 'POST':
-        password = request.form['password']
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        fields = ('username', 'password', 'first_name', 'last_name', 'email')
+        form = {field: request.form.get(field) for field in fields}
+        # Reject incomplete submissions before paying for a bcrypt hash
+        if not all(form.values()):
+            return 'Bad request', 400
 
         user_id = backend.create_user(
-            username=request.form['username'], 
-            password = hashed_password,
-            first_name=request.form['first_name'], 
-            last_name=request.form['last_name'],
-            email=request.form['email']
+            username=form['username'], 
+            password=form['password'],
+            first_name=form['first_name'], 
+            last_name=form['last_name'],
+            email=form['email']
         )
 
         if user_id:
             flash('Account created successfully! Please log in.', 'success')
-            return redirect(url_for('login'))
+            return redirect(url_for('login'), code=303)
         else:
             flash('Username or email already exists.', 'danger')
     
@@ -108,9 +231,11 @@ def register():
 @app.route('/logout')
 def logout():
     """
-    Logs the user out by clearing the session.
+    Logs the user out by removing the login keys from the session.
+    Other session data (e.g. pending flash messages) is left alone.
     """
-    session.clear()
+    session.pop('user_id', None)
+    session.pop('username', None)
     flash('You have been logged out.', 'info')
     return redirect(url_for('login'))
 
@@ -120,13 +245,21 @@ def logout():
 def dashboard():
     """
     Serves the main dashboard page.
-    Redirects to login if the user is not authenticated.
+    Anonymous users are sent to login by require_login.
     """
-    if not is_logged_in():
-        return redirect(url_for('login'))
-    
     # You can add dashboard-specific logic here, like "recently played"
-    return render_template('dashboard.html')
+    # The page only varies by who is logged in, so the ETag is keyed on the user.
+    # no-cache makes the browser revalidate every time, so after a logout or a
+    # login as someone else it never shows the previous user's page.
+    fingerprint = repr((g.user_id, session.get('username')))
+    etag = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+    if not has_pending_flashes() and etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        response = make_response(render_template('dashboard.html'))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @app.route('/search')
 def search():
@@ -134,30 +267,37 @@ def search():
     Handles the main search page for songs.
     Takes search and sorting parameters from the URL (GET request).
     """
-    if not is_logged_in():
-        return redirect(url_for('login'))
-
     # Get search parameters from the URL
     search_term = request.args.get('term', '')
     search_type = request.args.get('type', '')
     sort_by = request.args.get('sort', 'song_name') # Default sort
     sort_order = request.args.get('order', 'ASC')   # Default order
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    per_page = backend.SEARCH_PAGE_SIZE
 
-    search_results = []
-    
-    # If a search was performed, fetch results from the backend
+    # Always get the user's collections for the "Add to Collection" dropdown.
+    # Fetched first so it does not need a second connection while results stream.
+    user_collections = get_user_collections_cached(g.user_id)
+
+    # Results are a generator streamed straight from the database
     search_results = backend.search_songs(
-        user_id=session['user_id'],
+        user_id=g.user_id,
         search_term=search_term or '', 
         search_type=search_type or None,
         sort_by=sort_by,
-        sort_order=sort_order
+        sort_order=sort_order,
+        limit=per_page,
+        offset=(page - 1) * per_page
     )
-    
-    # Always get the user's collections for the "Add to Collection" dropdown
-    user_collections = backend.get_user_collections(session['user_id'])
 
-    return render_template(
+    # Peek at the first row so the template can still tell "no results" apart
+    first_row = next(search_results, None)
+    search_results = itertools.chain([first_row], search_results) if first_row is not None else []
+
+    return stream_page(
         'search.html',
         results=search_results,
         collections=user_collections,
@@ -165,7 +305,9 @@ def search():
         term=search_term,
         type=search_type,
         sort=sort_by,
-        order=sort_order
+        order=sort_order,
+        page=page,
+        per_page=per_page
     )
 
 # --- Collection Management Routes ---
@@ -175,28 +317,34 @@ def collections():
     """
     Displays a list of the user's collections.
     """
-    if not is_logged_in():
-        return redirect(url_for('login'))
-        
-    user_collections = backend.get_user_collections(session['user_id'])
-    return render_template('collections.html', collections=user_collections)
+    user_collections = get_user_collections_cached(g.user_id)
+
+    # The ETag changes whenever the list (or any count/length in it) changes,
+    # so an unchanged list is answered with 304 and no re-render.
+    fingerprint = repr((g.user_id, [tuple(c) for c in user_collections]))
+    etag = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+    if not has_pending_flashes() and etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        response = make_response(render_template('collections.html', collections=user_collections))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @app.route('/collection/create', methods=['POST'])
 def create_collection():
     """
     Handles the creation of a new, empty collection (POST request).
     """
-    if not is_logged_in():
-        return redirect(url_for('login'))
-        
     title = request.form.get('title')
     if title:
-        if not backend.create_collection(session['user_id'], title):
+        if not backend.create_collection(g.user_id, title):
             flash('A collection with that name already exists.', 'danger')
         else:
+            invalidate_user_collections(g.user_id)
             flash('Collection created successfully.', 'success')
             
-    return redirect(url_for('collections'))
+    return redirect(url_for('collections'), code=303)
 
 @app.route('/collection/<string:collection_title>')
 def collection_details(collection_title):
@@ -204,78 +352,81 @@ def collection_details(collection_title):
     Displays the details and list of songs for a specific collection.
     Identifies the collection by its title.
     """
-    if not is_logged_in():
-        return redirect(url_for('login'))
-        
-    details = backend.get_collection_details(session['user_id'], collection_title)
+    details = backend.get_collection_details(g.user_id, collection_title)
     
     if not details:
         flash('Collection not found.', 'danger')
         return redirect(url_for('collections'))
-        
-    return render_template('collectiondetails.html', collection=details)
+
+    # The songs are streamed from the database, so render the page as they arrive
+    return stream_page('collectiondetails.html', collection=details)
 
 @app.route('/collection/rename', methods=['POST'])
 def rename_collection():
     """
     Handles renaming a collection (POST request).
     """
-    if not is_logged_in():
-        return redirect(url_for('login'))
-        
     old_title = request.form.get('old_title')
     new_title = request.form.get('new_title')
     
     if old_title and new_title:
-        if backend.rename_collection(session['user_id'], old_title, new_title):
+        if backend.rename_collection(g.user_id, old_title, new_title):
+            invalidate_user_collections(g.user_id)
             flash('Collection renamed successfully.', 'success')
-            return redirect(url_for('collection_details', collection_title=new_title))
+            return redirect(url_for('collection_details', collection_title=new_title), code=303)
         else:
             flash('Failed to rename collection. Does a collection with the new name already exist?', 'danger')
-            return redirect(url_for('collection_details', collection_title=old_title))
+            return redirect(url_for('collection_details', collection_title=old_title), code=303)
             
-    return redirect(url_for('collections'))
+    return redirect(url_for('collections'), code=303)
 
 @app.route('/collection/delete', methods=['POST'])
 def delete_collection():
     """
     Handles deleting an entire collection (POST request).
     """
-    if not is_logged_in():
-        return redirect(url_for('login'))
-        
     title = request.form.get('title')
     if title:
-        backend.delete_collection(session['user_id'], title)
+        backend.delete_collection(g.user_id, title)
+        invalidate_user_collections(g.user_id)
         flash('Collection deleted.', 'info')
             
-    return redirect(url_for('collections'))
+    return redirect(url_for('collections'), code=303)
 
 # --- Song and "Play" Routes ---
 
 @app.route('/collection/add_song', methods=['POST'])
 def add_song_to_collection():
     """
-    Handles adding a single song to a collection (POST request).
+    Handles adding a single song, several songs or a whole album to a collection (POST request).
     """
-    if not is_logged_in():
-        return redirect(url_for('login'))
-
     collection_title = request.form.get('collection_title')
-    song_id = request.form.get('song_id')
+    song_ids = request.form.getlist('song_id') # Several when adding a selection of songs
+    song_id = song_ids[0] if song_ids else None
     album_id = request.form.get('album_id') # For adding an album
 
-    if song_id and collection_title:
+    if len(song_ids) > 1 and collection_title:
+        # Add several songs in one round-trip
+        added_count = backend.add_songs_to_collection(g.user_id, collection_title, song_ids)
+        if added_count > 0:
+            invalidate_user_collections(g.user_id)
+            flash(f'Added {added_count} songs to the collection.', 'success')
+        else:
+            flash('No new songs were added.', 'info')
+
+    elif song_id and collection_title:
         # Add a single song
-        if backend.add_song_to_collection(session['user_id'], collection_title, song_id):
+        if backend.add_song_to_collection(g.user_id, collection_title, song_id):
+            invalidate_user_collections(g.user_id)
             flash('Song added to collection.', 'success')
         else:
             flash('Song is already in that collection.', 'warning')
             
     elif album_id and collection_title:
         # Add all songs from an album
-        added_count = backend.add_album_to_collection(session['user_id'], collection_title, album_id)
+        added_count = backend.add_album_to_collection(g.user_id, collection_title, album_id)
         if added_count > 0:
+            invalidate_user_collections(g.user_id)
             flash(f'Added {added_count} songs from the album.', 'success')
         else:
             flash('No new songs were added from this album.', 'info')
@@ -284,55 +435,54 @@ def add_song_to_collection():
         flash('Invalid request.', 'danger')
 
     # Redirect back to the page the user was on
-    return redirect(request.referrer or url_for('dashboard'))
+    return redirect_back('dashboard')
 
 @app.route('/collection/remove_song', methods=['POST'])
 def remove_song_from_collection():
     """
     Handles removing a single song from a collection (POST request).
     """
-    if not is_logged_in():
-        return redirect(url_for('login'))
-            
     collection_title = request.form.get('collection_title')
     song_id = request.form.get('song_id')
     
     if collection_title and song_id:
-        backend.remove_song_from_collection(session['user_id'], collection_title, song_id)
+        backend.remove_song_from_collection(g.user_id, collection_title, song_id)
+        invalidate_user_collections(g.user_id)
         flash('Song removed from collection.', 'info')
             
-    return redirect(url_for('collection_details', collection_title=collection_title))
+    return redirect(url_for('collection_details', collection_title=collection_title), code=303)
 
 @app.route('/play/song/<int:song_id>', methods=['POST'])
 def play_song_route(song_id):
     """
     Logs that a user "played" a single song.
+    The play is only queued here; it is written in the background, so a
+    write failure is logged by the flusher rather than reported to the user.
+    Background (fetch) requests get an empty 204 so the page stays put;
+    plain form posts are redirected back with a flash message.
     """
-    if not is_logged_in():
-        return redirect(url_for('login'))
-        
-    backend.play_song(song_id, session['user_id'])
+    backend.play_song(song_id, g.user_id)
+    if request.headers.get('X-Requested-With') == 'fetch':
+        return ('', 204)
+
     flash('Song play logged!', 'success')
     
     # Redirect back to the page the user was on
-    return redirect(request.referrer or url_for('dashboard'))
+    return redirect_back('dashboard')
 
 @app.route('/play/collection/<string:collection_title>', methods=['POST'])
 def play_collection_route(collection_title):
     """
     Logs that a user "played" all songs in a collection.
     """
-    if not is_logged_in():
-        return redirect(url_for('login'))
-        
-    played_count = backend.play_collection(session['user_id'], collection_title)
+    played_count = backend.play_collection(g.user_id, collection_title)
     
     if played_count > 0:
         flash(f'Logged play for {played_count} songs in the collection.', 'success')
     else:
         flash('Could not play collection. Do you own it?', 'danger')
         
-    return redirect(url_for('collection_details', collection_title=collection_title))
+    return redirect(url_for('collection_details', collection_title=collection_title), code=303)
 
 @app.route('/rate/song', methods=['POST'])
 def rate_song_route():
@@ -340,22 +490,19 @@ def rate_song_route():
     Handles a user's rating submission for a song.
     The rating (1-5) is sent from a form.
     """
-    if not is_logged_in():
-        return redirect(url_for('login'))
-        
     song_id = request.form.get('song_id')
     rating = request.form.get('rating')
     
     if not song_id or not rating:
         flash("Invalid rating request.", 'danger')
-        return redirect(request.referrer or url_for('dashboard'))
+        return redirect_back('dashboard')
 
-    if backend.rate_song(session['user_id'], song_id, rating):
+    if backend.rate_song(g.user_id, song_id, rating):
         flash("Your rating has been saved.", 'success')
     else:
         flash("Invalid rating. Must be between 1 and 5.", 'danger')
         
-    return redirect(request.referrer or url_for('dashboard'))
+    return redirect_back('dashboard')
 
 
 # --- User Following Routes ---
@@ -367,18 +514,15 @@ def search_users():
     - GET: Shows the search form and list of users.
     - POST: Performs the search by email.
     """
-    if not is_logged_in():
-        return redirect(url_for('login'))
-
     users = []
     search_email = ""
     if request.method == 'POST':
         search_email = request.form.get('email', '')
         if search_email:
-            users = backend.search_users_by_email(session['user_id'], search_email)
+            users = backend.search_users_by_email(g.user_id, search_email)
     else:
         # On GET, just show all users to follow
-        users = backend.get_all_users_to_follow(session['user_id'])
+        users = backend.get_all_users_to_follow(g.user_id)
 
     return render_template('users.html', users=users, search_email=search_email)
 
@@ -387,40 +531,31 @@ def follow_user_route():
     """
     Handles the action of following another user.
     """
-    if not is_logged_in():
-        return redirect(url_for('login'))
-        
     followee_id = request.form.get('followee_id')
     if followee_id:
-        backend.follow_user(session['user_id'], followee_id)
+        backend.follow_user(g.user_id, followee_id)
         flash("User followed.", 'success')
    
-    return redirect(request.referrer or url_for('search_users'))
+    return redirect_back('search_users')
 
 @app.route('/unfollow', methods=['POST'])
 def unfollow_user_route():
     """
     Handles the action of unfollowing another user.
     """
-    if not is_logged_in():
-        return redirect(url_for('login'))
-        
     followee_id = request.form.get('followee_id')
     if followee_id:
-        backend.unfollow_user(session['user_id'], followee_id)
+        backend.unfollow_user(g.user_id, followee_id)
         flash("User unfollowed.", 'info')
 
-    return redirect(request.referrer or url_for('search_users'))
+    return redirect_back('search_users')
 
 @app.route('/profile')
 def profile():
     """
     Displays the user's profile page with their stats.
     """
-    if not is_logged_in():
-        return redirect(url_for('login'))
-
-    profile_data = backend.get_user_profile_data(session['user_id'])
+    profile_data = backend.get_user_profile_data(g.user_id)
 
     if not profile_data:
         flash('Could not retrieve profile data.', 'danger')
@@ -434,11 +569,8 @@ def popular_songs():
     """
     Displays the top 50 most popular songs.
     """
-    if not is_logged_in():
-        return redirect(url_for('login'))
-
     top_50_songs = backend.get_top_50_popular_songs()
-    top_50_followed_songs = backend.get_top_50_popular_songs_from_followed_users(session['user_id'])
+    top_50_followed_songs = backend.get_top_50_popular_songs_from_followed_users(g.user_id)
 
     return render_template('popular_songs.html', top_50_songs=top_50_songs, top_50_followed_songs=top_50_followed_songs)
 
@@ -447,9 +579,6 @@ def top_genres():
     """
     Displays the top 5 most popular genres of the month.
     """
-    if not is_logged_in():
-        return redirect(url_for('login'))
-
     top_5_genres = backend.get_top_5_genres_of_the_month()
 
     return render_template('top_genres.html', top_5_genres=top_5_genres)
@@ -9,84 +9,210 @@ This module contains all the functions that interact with the database.
 It serves as the data access layer, separating SQL logic from the web application's routing logic.
 '''
 from datetime import datetime  # Used to generate timestamps for creation and last access dates.
-from db_connector import get_db_connection  # Imports the connection manager from our connector file.
+import os  # Used to read the play flush interval from the environment.
+import time  # Paces the background play flusher.
+import atexit  # Flushes queued plays when the process exits.
+import threading  # Guards the play queue and starts its flusher thread.
+import itertools  # Used to put back the first streamed row after peeking.
+from collections import deque  # Queue of play events waiting to be written.
+from concurrent.futures import ThreadPoolExecutor  # Runs legacy-password upgrades off the request path.
+from db_connector import get_db_connection, execute_prepared  # Imports the connection manager from our connector file.
 #from src.db_connector import get_db_connection                 #Used for populating_user_table
 import psycopg2  # Imported specifically to catch psycopg2-related exceptions.
 from psycopg2.extras import DictCursor # Ensures we can access results by column name
-import bcrypt 
+from psycopg2.extras import NamedTupleCursor # Lighter rows for the search results page.
+from psycopg2.extras import execute_values # Sends many rows in one INSERT statement.
+import hmac  # Constant-time comparison for legacy plaintext passwords.
+import logging  # Reports database errors without blocking on stdout.
+import passwords # Centralized bcrypt hashing and verification.
+
+log = logging.getLogger(__name__)
 
 # --- User Management ---
 
 def create_user(username, password, first_name, last_name, email):
     """
-    Creates a new user with a PLAINTEXT password.
+    Creates a new user, storing a bcrypt hash of the plaintext password.
     Records creation and last access time.
     Schema-Compliant: Uses "users" table.
     """
-    now = datetime.now()
+    # Hash before taking a connection so bcrypt never holds a pool slot.
+    hashed_password = passwords.hash_password(password)
 
+    # The server stamps both dates, so every app server agrees on the clock.
     sql = """
         INSERT INTO "users" (Username, Password, FirstName, LastName, Email, CreationDate, LastAccessDate)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        VALUES (%s, %s, %s, %s, %s, NOW(), NOW())
         RETURNING UserID
     """
 
     try:
         # Use the context manager to get a connection
         with get_db_connection() as conn:
-            with conn.cursor() as curs:
-                curs.execute(sql, (username, password, first_name, last_name, email, now, now))
-                user_id = curs.fetchone()['userid']
-                #curs.execute("TRUNCATE TABLE users RESTART IDENTITY CASCADE")
-                print(user_id)
-                conn.commit()
-                return user_id
+            curs = conn.cached_cursor(tuple_rows=True)
+            execute_prepared(curs, 'create_user', sql, (username, hashed_password, first_name, last_name, email))
+            user_id = curs.fetchone()[0]
+            conn.commit()
+            return user_id
     except psycopg2.errors.UniqueViolation:
         # This error occurs if the username or email already exists
         return None
     except Exception as e:
-        print(f"Error creating user: {e}")
+        log.error("Error creating user: %s", e)
         # Rollback and close are handled by the context manager
         return None
 
+def create_users_bulk(users):
+    """
+    Creates many users in one round-trip, e.g. for an admin import.
+    Each user is a (username, password, first_name, last_name, email) tuple with
+    a plaintext password, like create_user; all passwords are bcrypt-hashed in
+    parallel (passwords.hash_passwords) before anything is stored.
+    Users whose username or email already exists are skipped.
+    Schema-Compliant: Uses "users" table.
+
+    Returns:
+        A list of (UserID, Username) for the users actually created.
+    """
+    sql = """
+        INSERT INTO "users" (Username, Password, FirstName, LastName, Email, CreationDate, LastAccessDate)
+        VALUES %s
+        ON CONFLICT DO NOTHING
+        RETURNING UserID, Username
+    """
+    users = list(users)
+    # Hash before taking a connection so bcrypt never holds a pool slot.
+    hashed_passwords = passwords.hash_passwords([password for _, password, _, _, _ in users])
+    rows = [(username, hashed_password, first_name, last_name, email)
+            for (username, _, first_name, last_name, email), hashed_password in zip(users, hashed_passwords)]
+    try:
+        with get_db_connection() as conn:
+            curs = conn.cached_cursor(tuple_rows=True)
+            created = execute_values(curs, sql, rows, template="(%s, %s, %s, %s, %s, NOW(), NOW())",
+                                     page_size=max(len(rows), 1), fetch=True)
+            conn.commit()
+            return created
+    except Exception as e:
+        log.error("Error creating users: %s", e)
+        return []
+
+# LastAccessDate is audit data, so logins only queue it; a background thread
+# writes the queued stamps in batches. Only the latest stamp per user is kept.
+ACCESS_FLUSH_INTERVAL = float(os.getenv("ACCESS_FLUSH_INTERVAL", "5"))  # seconds
+ACCESS_FLUSH_BATCH = 100
+_pending_access = {} # user_id -> latest access time
+_pending_access_lock = threading.Lock()
+_access_flusher = None
+
+def _flush_access_dates():
+    """
+    Writes the queued LastAccessDate stamps, ACCESS_FLUSH_BATCH users per UPDATE.
+    Returns the number of stamps taken off the queue.
+    """
+    global _pending_access
+    with _pending_access_lock:
+        batch, _pending_access = list(_pending_access.items()), {}
+    if not batch:
+        return 0
+
+    sql = """
+        UPDATE "users" U SET LastAccessDate = D.AccessDate
+        FROM (VALUES %s) AS D(UserID, AccessDate)
+        WHERE U.UserID = D.UserID
+    """
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as curs:
+                execute_values(curs, sql, batch, template="(%s::INTEGER, %s::TIMESTAMP)", page_size=ACCESS_FLUSH_BATCH)
+                conn.commit()
+    except Exception as e:
+        log.error("Failed to record %s access dates: %s", len(batch), e)
+    return len(batch)
+
+def _run_access_flusher():
+    """
+    Background loop that writes queued access dates every ACCESS_FLUSH_INTERVAL seconds.
+    """
+    while True:
+        time.sleep(ACCESS_FLUSH_INTERVAL)
+        _flush_access_dates()
+
+atexit.register(_flush_access_dates)
+
+def _record_access(user_id, when):
+    """
+    Queues a LastAccessDate stamp for the background flusher, starting it on first use.
+    """
+    global _access_flusher
+    with _pending_access_lock:
+        _pending_access[user_id] = when
+        if _access_flusher is None:
+            _access_flusher = threading.Thread(target=_run_access_flusher, name="access-flusher", daemon=True)
+            _access_flusher.start()
+
+# Runs legacy-password upgrades after the login that triggered them has returned.
+_PASSWORD_UPGRADES = ThreadPoolExecutor(max_workers=1, thread_name_prefix="password-upgrade")
+
+def _upgrade_legacy_password(user_id, password, legacy_value):
+    """
+    Private helper that replaces a legacy plaintext password with a bcrypt hash.
+    The UPDATE only applies while the old plaintext is still stored, so a
+    concurrent upgrade or password change is never overwritten.
+    """
+    sql = 'UPDATE "users" SET Password = %s WHERE UserID = %s AND Password = %s'
+    try:
+        hashed = passwords.hash_password(password)
+        with get_db_connection() as conn:
+            with conn.cursor() as curs:
+                curs.execute(sql, (hashed, user_id, legacy_value))
+                conn.commit()
+    except Exception as e:
+        log.error("Failed to upgrade legacy password for user %s: %s", user_id, e)
+
 def login_user(username, password):
     """
-    Logs a user in by checking their PLAINTEXT password.
-    Updates the LastAccessDate on successful login.
+    Logs a user in by checking their password against the stored bcrypt hash.
+    On success, queues a LastAccessDate update for the background writer.
     Schema-Compliant: Uses "users" table.
     """
-    sql_select = 'SELECT UserID, Username, Password FROM "users" WHERE Username = %s'
-    sql_update_access = 'UPDATE "users" SET LastAccessDate = %s WHERE UserID = %s'
+    # A plain read: the access date is recorded after a successful check, in the background.
+    sql_login = 'SELECT UserID, Username, Password FROM "users" WHERE Username = %s'
     
-    now = datetime.now()
     try:
-        # Use the context manager to get a connection
+        # Use the context manager to get a connection; nothing is written, so the
+        # pool just ends the read transaction when the connection is returned.
         with get_db_connection() as conn:
-            with conn.cursor() as curs:
-                curs.execute(sql_select, (username,))
-                user_record = curs.fetchone()
-
-                if not user_record:
-                    return None  # User not found
-
-                stored_password = user_record['password']
-                
-                # Direct plaintext comparison
-                if bcrypt.checkpw(password.encode('utf-8'), stored_password.encode('utf-8')):
-                    # Update last access time
-                    curs.execute(sql_update_access, (now, user_record['userid']))
-                    conn.commit()
-                    return {'userid': user_record['userid'], 'username': user_record['username']}
-                else:
-                    return None  # Incorrect password
-                    
+            curs = conn.cached_cursor(tuple_rows=True)
+            execute_prepared(curs, 'login_select', sql_login, (username,))
+            user_record = curs.fetchone() # (UserID, Username, Password) or None
     except Exception as e:
-        print(f"Login failed due to a database error: {e}")
-        # Rollback and close are handled by the context manager
+        log.error("Login failed due to a database error: %s", e)
         return None
 
+    # Encode the stored value once; both checks below work on bytes
+    stored_password = user_record[2].encode('utf-8') if user_record else None
+
+    if stored_password is not None and not passwords.is_bcrypt_hash(stored_password):
+        # Legacy plaintext account: compare in constant time, then upgrade
+        # the stored value to a bcrypt hash so this path runs only once.
+        if not hmac.compare_digest(stored_password, password.encode('utf-8')):
+            passwords.check_password(password, None) # Same bcrypt cost as any failed login
+            return None
+        # The re-hash happens in the background so the user doesn't wait on bcrypt.
+        _PASSWORD_UPGRADES.submit(_upgrade_legacy_password, user_record[0], password, user_record[2])
+    elif not passwords.check_password(password, stored_password):
+        # bcrypt runs even for unknown users, so timing does not reveal
+        # which usernames exist.
+        return None  # User not found or incorrect password
+
+    _record_access(user_record[0], datetime.now())
+    return {'userid': user_record[0], 'username': user_record[1]}
+
 # --- Collection Management ---
 
+# Number of rows pulled from the server per round-trip when streaming results.
+STREAM_FETCH_SIZE = 200
+
 def get_user_collections(user_id):
     """
     Gets all collections for a specific user.
@@ -95,63 +221,77 @@ def get_user_collections(user_id):
     sql = 'SELECT Title, NumberOfSongs, Length FROM "collection" WHERE UserID = %s ORDER BY Title ASC'
     try:
         with get_db_connection() as conn:
-            with conn.cursor() as curs:
-                curs.execute(sql, (user_id,))
-                return curs.fetchall()
+            curs = conn.cached_cursor()
+            execute_prepared(curs, 'get_user_collections', sql, (user_id,))
+            return curs.fetchall()
     except Exception as e:
-        print(f"Failed to get collections: {e}")
+        log.error("Failed to get collections: %s", e)
         return [] # Return empty list on error
     
+def _stream_rows(cursor_name, sql, params):
+    """
+    Private helper that runs a query on a named (server-side) cursor and yields
+    its rows STREAM_FETCH_SIZE at a time instead of loading them all at once.
+    The pooled connection is held until the generator is exhausted or closed.
+    """
+    try:
+        with get_db_connection() as conn:
+            # A named cursor keeps the result set on the server and fetches it in batches
+            with conn.cursor(name=cursor_name) as curs:
+                curs.itersize = STREAM_FETCH_SIZE
+                curs.execute(sql, params)
+                yield from curs
+    except Exception as e:
+        log.error("Failed to stream %s: %s", cursor_name, e)
+
 def get_collection_details(user_id, collection_title):
     """
     Gets a specific collection's info AND all songs within it.
-    Schema-Compliant: Identifies collection by (UserID, Title) and uses all bridge tables.
+    Schema-Compliant: Identifies collection by (UserID, Title), reads song
+    details from "song" and the artist/album/genre lists from "song_search".
+    The songs are an iterator streamed from a server-side cursor (see _stream_rows),
+    or an empty list for an empty collection. Returns None if the collection doesn't exist.
     """
     collection_info = {
         'title': collection_title,
         'songs': []
     }
    
+    # Each song's artist, album and genre lists come pre-joined from "song_search"
+    # (see sql/song_search.sql), so there is one row per song and no GROUP BY
+    # over an artist x album x genre fan-out. The view is only refreshed by hand,
+    # so the song's own columns are read from the live "song" table; a song
+    # loaded since the last refresh just shows empty lists until then.
     sql_songs = """
         SELECT 
-            S.SongID, 
+            CO.SongID, 
             S.Title AS SongTitle, 
             S.Length, 
             S.ReleaseDate,
-            COALESCE(STRING_AGG(DISTINCT A.Name, ',' ORDER BY A.Name), '') AS artist_list,
-            COALESCE(STRING_AGG(DISTINCT AL.Name, ',' ORDER BY AL.Name), '') AS album_list,
-            COALESCE(STRING_AGG(DISTINCT G.GenreType, ',' ORDER BY G.GenreType), '') AS genre_list,
-            MAX(R.Rating) AS Rating
-        FROM "consists_of" AS CO
-        JOIN "song" S ON S.SongID = CO.SongID
-        LEFT JOIN "performs" P ON S.SongID = P.SongID
-        LEFT JOIN "artist" A ON P.ArtistID = A.ArtistID
-        LEFT JOIN "contains" C ON S.SongID = C.SongID
-        LEFT JOIN "album" AL ON C.AlbumID = AL.AlbumID
-        LEFT JOIN "has" H ON S.SongID = H.SongID
-        LEFT JOIN "genres" G ON H.GenreID = G.GenreID
-        LEFT JOIN "rates" R ON S.SongID = R.SongID AND R.UserID = %s
-        WHERE CO.UserID = %s AND CO.Title = %s
-        GROUP BY S.SongID, S.Title, S.Length, S.ReleaseDate
+            COALESCE(SS.artist_list, '') AS artist_list,
+            COALESCE(SS.album_list, '') AS album_list,
+            COALESCE(SS.genre_list, '') AS genre_list,
+            R.Rating
+        FROM "collection" AS CL
+        LEFT JOIN "consists_of" AS CO ON CO.UserID = CL.UserID AND CO.Title = CL.Title
+        LEFT JOIN "song" S ON S.SongID = CO.SongID
+        LEFT JOIN "song_search" SS ON SS.SongID = CO.SongID
+        LEFT JOIN "rates" R ON R.SongID = CO.SongID AND R.UserID = CL.UserID
+        WHERE CL.UserID = %(uid)s AND CL.Title = %(title)s
         ORDER BY S.Title
     """
-    try:
-        with get_db_connection() as conn:
-            with conn.cursor() as curs:
-                curs.execute(sql_songs, (user_id, user_id, collection_title))
-                songs = curs.fetchall()
-                
-                if not songs:
-                    # Check if the collection *exists* but is just empty
-                    curs.execute('SELECT 1 FROM "collection" WHERE UserID = %s AND Title = %s', (user_id, collection_title))
-                    if curs.fetchone() is None:
-                        return None # Collection doesn't exist at all
-                
-                collection_info['songs'] = songs
-                return collection_info
-    except Exception as e:
-        print(f"Failed to get collection details: {e}")
-        return None
+    # Starting from "collection" means an empty collection still yields one row
+    # (with a NULL SongID), so one query tells "empty" apart from "missing".
+    songs = _stream_rows('collection_songs', sql_songs, {'uid': user_id, 'title': collection_title})
+    first_song = next(songs, None)
+    if first_song is None:
+        return None # Collection doesn't exist at all
+    if first_song['songid'] is None:
+        songs.close() # Release the connection; the collection is just empty
+        return collection_info
+
+    collection_info['songs'] = itertools.chain([first_song], songs)
+    return collection_info
 
 
 def create_collection(user_id, title):
@@ -162,15 +302,15 @@ def create_collection(user_id, title):
     sql = 'INSERT INTO "collection" (UserID, Title, NumberOfSongs, Length) VALUES (%s, %s, 0, 0)'
     try:
         with get_db_connection() as conn:
-            with conn.cursor() as curs:
-                curs.execute(sql, (user_id, title))
-                conn.commit()
-                return True
+            curs = conn.cached_cursor(tuple_rows=True)
+            execute_prepared(curs, 'create_collection', sql, (user_id, title))
+            conn.commit()
+            return True
     except psycopg2.errors.UniqueViolation:
         # Collection with this (UserID, Title) already exists
         return False
     except Exception as e:
-        print(f"Failed to create collection: {e}")
+        log.error("Failed to create collection: %s", e)
         return False
 
 def rename_collection(user_id, old_title, new_title):
@@ -181,15 +321,15 @@ def rename_collection(user_id, old_title, new_title):
     sql = 'UPDATE "collection" SET Title = %s WHERE UserID = %s AND Title = %s'
     try:
         with get_db_connection() as conn:
-            with conn.cursor() as curs:
-                curs.execute(sql, (new_title, user_id, old_title))
-                conn.commit()
-                return curs.rowcount > 0 # Returns True if a row was updated
+            curs = conn.cached_cursor(tuple_rows=True)
+            execute_prepared(curs, 'rename_collection', sql, (new_title, user_id, old_title))
+            conn.commit()
+            return curs.rowcount > 0 # Returns True if a row was updated
     except psycopg2.errors.UniqueViolation:
         # A collection with the new name (UserID, NewTitle) already exists
         return False
     except Exception as e:
-        print(f"Failed to rename collection: {e}")
+        log.error("Failed to rename collection: %s", e)
         return False
 
 def delete_collection(user_id, title):
@@ -200,65 +340,39 @@ def delete_collection(user_id, title):
     sql = 'DELETE FROM "collection" WHERE UserID = %s AND Title = %s'
     try:
         with get_db_connection() as conn:
-            with conn.cursor() as curs:
-                curs.execute(sql, (user_id, title))
-                conn.commit()
-                return True
+            curs = conn.cached_cursor(tuple_rows=True)
+            execute_prepared(curs, 'delete_collection', sql, (user_id, title))
+            conn.commit()
+            return True
     except Exception as e:
-        print(f"Failed to delete collection: {e}")
+        log.error("Failed to delete collection: %s", e)
         return False
 
 # --- Song and Search Management ---
 
-def _update_collection_stats(curs, user_id, collection_title):
-    """
-    Private helper function to update a collection's song count and total length.
-    This should be called *within* a transaction, passing the cursor.
-    """
-    sql_update_stats = """
-        WITH Stats AS (
-            SELECT
-                COUNT(S.SongID) AS SongCount,
-                COALESCE(SUM(S.Length), 0) AS TotalLength
-            FROM "consists_of" CO
-            JOIN "song" S ON CO.SongID = S.SongID
-            WHERE CO.UserID = %s AND CO.Title = %s
-        )
-        UPDATE "collection" C
-        SET
-            NumberOfSongs = S.SongCount,
-            Length = S.TotalLength
-        FROM Stats S
-        WHERE C.UserID = %s AND C.Title = %s;
-    """
-    curs.execute(sql_update_stats, (user_id, collection_title, user_id, collection_title))
-
+# Number of search results shown per page.
+SEARCH_PAGE_SIZE = 50
 
 def add_song_to_collection(user_id, collection_title, song_id):
     """
     Adds a single song to a collection.
-    Schema-Compliant: Inserts into "consists_of" and updates "collection" stats.
+    Schema-Compliant: Inserts into "consists_of"; a trigger updates the
+    "collection" stats (see sql/collection_stats.sql).
     """
-    sql_insert = 'INSERT INTO "consists_of" (UserID, Title, SongID) VALUES (%s, %s, %s)'
+    # A duplicate is skipped rather than raised, so it doesn't abort the transaction.
+    sql_insert = 'INSERT INTO "consists_of" (UserID, Title, SongID) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING'
     try:
         with get_db_connection() as conn:
-            with conn.cursor() as curs:
-                # Insert the song into the bridge table
-                curs.execute(sql_insert, (user_id, collection_title, song_id))
-                
-                # Update the collection stats in the same transaction
-                _update_collection_stats(curs, user_id, collection_title)
-                
-                conn.commit()
-                return True
-    except psycopg2.errors.UniqueViolation:
-        # Song is already in the collection
-        return False
+            curs = conn.cached_cursor(tuple_rows=True)
+            execute_prepared(curs, 'add_song_to_collection', sql_insert, (user_id, collection_title, song_id))
+            added = curs.rowcount > 0 # False if the song is already in the collection
+            conn.commit()
+            return added
     except psycopg2.errors.ForeignKeyViolation:
         # User doesn't own this collection, or song doesn't exist
         return False
     except Exception as e:
-        print(f"Failed to add song to collection: {e}")
+        log.error("Failed to add song to collection: %s", e)
         return False
 
 def add_album_to_collection(user_id, collection_title, album_id):
@@ -267,189 +381,270 @@ def add_album_to_collection(user_id, collection_title, album_id):
     Ignores songs that are already in the collection.
     Returns the number of *new* songs added.
     """
+    # The cast pins the UserID parameter's type: in a SELECT list a prepared
+    # statement would otherwise infer it as text.
     sql_insert_album = """
         INSERT INTO "consists_of" (UserID, Title, SongID)
-        SELECT %s, %s, C.SongID
+        SELECT %s::INTEGER, %s, C.SongID
         FROM "contains" C
         WHERE C.AlbumID = %s
-        AND NOT EXISTS (
-            SELECT 1
-            FROM "consists_of" CO
-            WHERE CO.UserID = %s
-            AND CO.Title = %s
-            AND CO.SongID = C.SongID
-        )
+        ON CONFLICT DO NOTHING
     """
     try:
         with get_db_connection() as conn:
-            with conn.cursor() as curs:
-                curs.execute(sql_insert_album, (user_id, collection_title, album_id, user_id, collection_title))
-                added_count = curs.rowcount # Get how many songs were inserted
-                
-                # Update the collection stats in the same transaction
-                _update_collection_stats(curs, user_id, collection_title)
-                
-                conn.commit()
-                return added_count
+            curs = conn.cached_cursor(tuple_rows=True)
+            execute_prepared(curs, 'add_album_to_collection', sql_insert_album, (user_id, collection_title, album_id))
+            added_count = curs.rowcount
+            conn.commit()
+            return added_count
     except Exception as e:
-        print(f"Failed to add album to collection: {e}")
+        log.error("Failed to add album to collection: %s", e)
         return 0
 
+def add_songs_to_collection(user_id, collection_title, song_ids):
+    """
+    Adds many songs to a collection in one statement.
+    Ignores songs that are already in the collection or don't exist.
+    Returns the number of *new* songs added.
+    """
+    # The ID list is sent as one array parameter, so every batch size shares
+    # one prepared statement.
+    sql_insert_songs = """
+        INSERT INTO "consists_of" (UserID, Title, SongID)
+        SELECT %s::INTEGER, %s, S.SongID
+        FROM "song" S
+        WHERE S.SongID = ANY(%s::INTEGER[])
+        ON CONFLICT DO NOTHING
+    """
+    try:
+        song_ids = [int(song_id) for song_id in song_ids]
+    except (TypeError, ValueError):
+        return 0
+    if not song_ids:
+        return 0
+    try:
+        with get_db_connection() as conn:
+            curs = conn.cached_cursor(tuple_rows=True)
+            execute_prepared(curs, 'add_songs_to_collection', sql_insert_songs, (user_id, collection_title, song_ids))
+            added_count = curs.rowcount
+            conn.commit()
+            return added_count
+    except Exception as e:
+        log.error("Failed to add songs to collection: %s", e)
+        return 0
 
 def remove_song_from_collection(user_id, collection_title, song_id):
     """
     Removes a single song from a collection.
-    Schema-Compliant: Deletes from "consists_of" and updates "collection" stats.
+    Schema-Compliant: Deletes from "consists_of"; a trigger updates the
+    "collection" stats (see sql/collection_stats.sql).
     """
     sql_delete = 'DELETE FROM "consists_of" WHERE UserID = %s AND Title = %s AND SongID = %s'
     try:
         with get_db_connection() as conn:
-            with conn.cursor() as curs:
-                # Delete the song from the bridge table
-                curs.execute(sql_delete, (user_id, collection_title, song_id))
-                deleted_count = curs.rowcount
-                
-                if deleted_count > 0:
-                    # Update stats only if a song was actually deleted
-                    _update_collection_stats(curs, user_id, collection_title)
-                
-                conn.commit()
-                return deleted_count > 0
+            curs = conn.cached_cursor(tuple_rows=True)
+            execute_prepared(curs, 'remove_song_from_collection', sql_delete, (user_id, collection_title, song_id))
+            deleted_count = curs.rowcount
+            conn.commit()
+            return deleted_count > 0
     except Exception as e:
-        print(f"Failed to remove song from collection: {e}")
+        log.error("Failed to remove song from collection: %s", e)
         return False
 
-def search_songs(user_id, search_term, search_type, sort_by, sort_order):
-    """
-    Searches for songs based on various criteria and sorting options.
-    Schema-Compliant: Uses LEFT JOINs and dynamically
-    calculates listencount from "plays".
-    """
-    # Whitelist sort options to prevent SQL injection
-    sort_columns_map = {
-        'song_name': 'S.Title',
-        'artist_name': 'artist_list',
-        'album_name' : 'album_list',
-        'genre_name': 'G.GenreType',
-        'ReleaseDate': 'S.ReleaseDate'
-    }
-    sort_order_map = {'ASC': 'ASC', 'DESC': 'DESC'}
-
-    # Default to safe values if inputs are invalid
-    sort_column = sort_columns_map.get(sort_by, 'S.Title')
-    sort_direction = sort_order_map.get(sort_order, 'ASC')
-    
-    base_query = f"""
+# Filter each search type applies, matched against every title or name on its
+# own (never a joined list) and read from the live tables, so new songs are
+# searchable immediately. Only these fixed strings (never user input) are ever
+# spliced into the search SQL.
+_SEARCH_FILTERS = {
+    'song': "S.Title ILIKE %s",
+    'artist': """EXISTS(
+                SELECT 1
+                FROM "performs" P2
+                JOIN "artist" A2 ON P2.ArtistID = A2.ArtistID
+                WHERE P2.SongID = S.SongID AND A2.Name ILIKE %s)""",
+    'album': """EXISTS(
+                SELECT 1
+                FROM "contains" C2
+                JOIN "album" AL2 ON C2.AlbumID = AL2.AlbumID
+                WHERE C2.SongID = S.SongID AND AL2.Name ILIKE %s)""",
+    'genre': """EXISTS(
+                SELECT 1
+                FROM "has" H2
+                JOIN "genres" G2 ON H2.GenreID = G2.GenreID
+                WHERE H2.SongID = S.SongID AND G2.GenreType ILIKE %s)"""
+}
+
+# ORDER BY for each whitelisted sort option; None is the fallback for unknown options.
+_SEARCH_SORTS = {
+    'song_name': 'S.Title {direction}, artist_list ASC',
+    'artist_name': 'artist_list {direction}, S.Title ASC',
+    'album_name': 'album_list {direction}',
+    'genre_name': "SPLIT_PART(genre_list, ',', 1) {direction}",
+    'ReleaseDate': 'S.ReleaseDate {direction}',
+    'song.releasedate': 'releasedate {direction}',
+    None: 'S.Title {direction}'
+}
+_SEARCH_DIRECTIONS = ('ASC', 'DESC')
+_SEARCH_DEFAULT_ORDER = 'S.Title ASC, artist_list ASC' # Browsing without a search
+
+def _build_search_sql():
+    """
+    Private helper that composes every variant of the search query once, at import.
+    Songs and filters come from the live tables; only the display lists of
+    artist, album and genre names are read pre-joined from "song_search"
+    (see sql/song_search.sql), so no bridge tables are aggregated here.
+
+    Returns:
+        A dict of (search type or None, (sort option, direction) or None) -> (statement name, SQL).
+    """
+    base_query = """
         SELECT 
             S.SongID, 
             S.Title AS song_name, 
-            COALESCE(STRING_AGG(DISTINCT A.Name, ',' ORDER BY A.Name), '') AS artist_list,
-            COALESCE(STRING_AGG(DISTINCT AL.Name, ',' ORDER BY AL.Name), '') AS album_list,
-            COALESCE(STRING_AGG(DISTINCT G.GenreType, ',' ORDER BY G.GenreType), '') AS genre_list, 
-            (SELECT COUNT(*) FROM "plays" P WHERE P.SongID = S.SongID AND P.UserID = %s) AS listencount, 
+            COALESCE(SS.artist_list, '') AS artist_list,
+            COALESCE(SS.album_list, '') AS album_list,
+            SS.AlbumID,
+            COALESCE(SS.genre_list, '') AS genre_list, 
+            COALESCE(USP.PlayCount, 0) AS listencount, 
             S.Length, 
             S.ReleaseDate
-        FROM song S
-        LEFT JOIN performs P ON S.SongID = P.SongID
-        LEFT JOIN artist A ON P.ArtistID = A.ArtistID
-        LEFT JOIN contains C ON S.SongID = C.SongID
-        LEFT JOIN album AL ON C.AlbumID = AL.AlbumID
-        LEFT JOIN has H ON S.SongID = H.SongID
-        LEFT JOIN genres G ON H.GenreID = G.GenreID
+        FROM "song" S
+        LEFT JOIN "song_search" SS ON SS.SongID = S.SongID
+        LEFT JOIN "user_song_plays" USP ON USP.SongID = S.SongID AND USP.UserID = %s
     """
+    orders = {None: _SEARCH_DEFAULT_ORDER}
+    for sort_by, order in _SEARCH_SORTS.items():
+        for direction in _SEARCH_DIRECTIONS:
+            orders[(sort_by, direction)] = order.format(direction=direction)
 
-    params = [user_id]
-    where_clause = ""
-
-    if search_term and search_type:
-        search_pattern = f"%{search_term}%"
-        if search_type == 'song':
-            where_clause = "WHERE S.Title ILIKE %s"
-            params.append(search_pattern,)
-        elif search_type == 'artist':
-            where_clause = """
-                WHERE EXISTS(
-                    SELECT 1
-                    FROM performs P2
-                    JOIN artist A2 ON P2.ArtistID = A2.ArtistID
-                    WHERE P2.SongID = S.SongID AND A2.Name ILIKE %s)
-            """
-            params.append(search_pattern,)
-        elif search_type == 'album':
-            where_clause = """
-                WHERE EXISTS(
-                    SELECT 1
-                    FROM contains C2
-                    JOIN album AL2 ON C2.AlbumID = AL2.AlbumID
-                    WHERE C2.SongID = S.SongID AND AL2.Name ILIKE %s
-                )
-            """
-            params.append(search_pattern,)
-        elif search_type == 'genre':
-            where_clause = """
-                WHERE EXISTS(
-                    SELECT 1
-                    FROM has H2
-                    JOIN genres G2 ON H2.GenreID = G2.GenreID
-                    WHERE H2.SongID = S.SongID AND G2.GenreType ILIKE %s)
-            """
-            params.append(search_pattern,)
-
-
-    group_by_clause = """
-        GROUP BY 
-            S.SongID,
-            S.Title,
-            S.Length,
-            S.ReleaseDate
-    """
+    variants = {}
+    for search_type in [None, *_SEARCH_FILTERS]:
+        where_clause = f"WHERE {_SEARCH_FILTERS[search_type]}" if search_type else ""
+        for order_key, order_by in orders.items():
+            name = f"search_songs_{len(variants)}"
+            variants[(search_type, order_key)] = (name, f"{base_query} {where_clause} ORDER BY {order_by} LIMIT %s OFFSET %s")
+    return variants
 
+_SEARCH_SQL = _build_search_sql()
+
+def search_songs(user_id, search_term, search_type, sort_by, sort_order, limit=SEARCH_PAGE_SIZE, offset=0):
+    """
+    Searches for songs based on various criteria and sorting options.
+    Schema-Compliant: Reads songs from "song", their artist/album/genre lists
+    from the pre-joined "song_search" view (see sql/song_search.sql), and
+    listencount from "user_song_plays", which a trigger on "plays" keeps up
+    to date (see sql/play_counts.sql).
+    Only one page of `limit` rows starting at `offset` is returned, so the
+    database can stop after the top rows instead of sorting everything.
+    Each (search type, sort) variant of the query is composed once at import
+    and runs as a server-side prepared statement, so repeated searches skip
+    parsing and planning.
+    This is a generator; the page is fetched in one round-trip and the
+    connection is back in the pool before the first row is yielded.
+    """
+    # Unknown search types and sort options fall back to safe defaults
+    search_filter = search_type if search_term and search_type in _SEARCH_FILTERS else None
     if not search_term and not search_type:
-        order_by_clause = """
-            ORDER BY 
-                S.Title ASC,
-                COALESCE(STRING_AGG(DISTINCT A.Name, ',' ORDER BY A.Name), '') ASC
-        """
+        order_key = None
     else:
-        order_by_clause = f"ORDER BY {sort_column} {sort_direction}"
-        if sort_by == 'song_name':
-            order_by_clause += ', artist_list ASC'
-        elif sort_by == 'artist_name':
-            order_by_clause += ', S.Title ASC'
-        elif sort_by == 'genre_name':
-            order_by_clause = f"ORDER BY SPLIT_PART(COALESCE(STRING_AGG(DISTINCT G.GenreType, ',' ORDER BY G.GenreType), ''), ',', 1) {sort_direction}"
-        elif sort_by == 'song.releasedate':
-            order_by_clause = f"ORDER BY releasedate {sort_direction}"
-
-    sql = f"{base_query} {where_clause} {group_by_clause} {order_by_clause}"
+        order_key = (sort_by if sort_by in _SEARCH_SORTS else None,
+                     sort_order if sort_order in _SEARCH_DIRECTIONS else 'ASC')
+    statement_name, sql = _SEARCH_SQL[(search_filter, order_key)]
+
+    params = [user_id]
+    if search_filter:
+        params.append(f"%{search_term}%")
+    params.extend([limit, offset])
 
     try:
         with get_db_connection() as conn:
-            with conn.cursor() as curs:
-                curs.execute(sql, params)
-                return curs.fetchall()
+            # Named tuples are cheaper to build than DictRows and still give
+            # the template attribute access (song.song_name).
+            with conn.cursor(cursor_factory=NamedTupleCursor) as curs:
+                execute_prepared(curs, statement_name, sql, params)
+                rows = curs.fetchall()
     except Exception as e:
-        print(f"Failed to search songs: {e}")
-        return []
+        log.error("Failed to search songs: %s", e)
+        return
+    yield from rows
 
 # --- "Play" and "Follow" Functions ---
 
-def play_song(song_id, user_id):
-    """
-    Logs that a user played a song.
-    Schema-Compliant: Inserts a record into "plays".
-    """
-    sql_log = 'INSERT INTO "plays" (UserID, SongID, PlayDate) VALUES (%s, %s, %s)'
-    now = datetime.now()
+# Plays are queued in memory and written in batches with one multi-row INSERT,
+# instead of one INSERT + COMMIT round-trip per click. (Not COPY: psycopg2
+# refuses copy_expert once psycogreen's wait callback is installed, as it is
+# under the gevent workers.) A crash can lose up to one flush
+# interval of plays.
+PLAY_FLUSH_INTERVAL = float(os.getenv("PLAY_FLUSH_INTERVAL", "1"))  # seconds
+PLAY_FLUSH_BATCH = 1000
+_pending_plays = deque()
+_pending_plays_lock = threading.Lock()
+_play_flusher = None
+
+def _flush_plays():
+    """
+    Writes up to PLAY_FLUSH_BATCH queued plays to "plays" with a single INSERT.
+    If the batch is rejected (e.g. a song was deleted), the rows are retried one
+    at a time so a single bad play doesn't drop the others.
+    Returns the number of plays taken off the queue.
+    """
+    with _pending_plays_lock:
+        batch = [_pending_plays.popleft() for _ in range(min(PLAY_FLUSH_BATCH, len(_pending_plays)))]
+    if not batch:
+        return 0
+
     try:
         with get_db_connection() as conn:
             with conn.cursor() as curs:
-                curs.execute(sql_log, (user_id, song_id, now))
-                conn.commit()
-                return True
+                try:
+                    execute_values(curs, 'INSERT INTO "plays" (UserID, SongID, PlayDate) VALUES %s', batch,
+                                   page_size=PLAY_FLUSH_BATCH)
+                    conn.commit()
+                except psycopg2.Error as e:
+                    conn.rollback()
+                    log.warning("Batched play logging failed, retrying row by row: %s", e)
+                    for row in batch:
+                        try:
+                            curs.execute('INSERT INTO "plays" (UserID, SongID, PlayDate) VALUES (%s, %s, %s)', row)
+                            conn.commit()
+                        except psycopg2.Error as row_error:
+                            conn.rollback()
+                            log.error("Failed to log play %s: %s", row, row_error)
     except Exception as e:
-        print(f"Failed to play song: {e}")
-        return False
+        log.error("Failed to flush %s plays: %s", len(batch), e)
+    return len(batch)
+
+def _run_play_flusher():
+    """
+    Background loop that drains the play queue every PLAY_FLUSH_INTERVAL seconds.
+    """
+    while True:
+        time.sleep(PLAY_FLUSH_INTERVAL)
+        while _flush_plays() == PLAY_FLUSH_BATCH:
+            pass
+
+def _flush_all_plays():
+    """
+    Drains the whole play queue. Registered with atexit so queued plays are
+    written before the connection pool is closed.
+    """
+    while _flush_plays():
+        pass
+
+atexit.register(_flush_all_plays)
+
+def play_song(song_id, user_id):
+    """
+    Logs that a user played a song.
+    Schema-Compliant: Queues a record for "plays"; it is written by the
+    background flusher within PLAY_FLUSH_INTERVAL seconds.
+    """
+    global _play_flusher
+    with _pending_plays_lock:
+        _pending_plays.append((user_id, song_id, datetime.now()))
+        if _play_flusher is None:
+            _play_flusher = threading.Thread(target=_run_play_flusher, name="play-flusher", daemon=True)
+            _play_flusher.start()
 
 def play_collection(user_id, collection_title):
     """
@@ -458,20 +653,19 @@ def play_collection(user_id, collection_title):
     """
     sql_log_all = """
         INSERT INTO "plays" (UserID, SongID, PlayDate)
-        SELECT %s, SongID, %s
+        SELECT UserID, SongID, NOW()
         FROM "consists_of"
         WHERE UserID = %s AND Title = %s
     """
-    now = datetime.now()
     try:
         with get_db_connection() as conn:
-            with conn.cursor() as curs:
-                curs.execute(sql_log_all, (user_id, now, user_id, collection_title))
-                played_count = curs.rowcount # Get how many songs were logged
-                conn.commit()
-                return played_count
+            curs = conn.cached_cursor(tuple_rows=True)
+            execute_prepared(curs, 'play_collection', sql_log_all, (user_id, collection_title))
+            played_count = curs.rowcount # Get how many songs were logged
+            conn.commit()
+            return played_count
     except Exception as e:
-        print(f"Failed to play collection: {e}")
+        log.error("Failed to play collection: %s", e)
         return 0
 
 def rate_song(user_id, song_id, rating):
@@ -482,10 +676,10 @@ def rate_song(user_id, song_id, rating):
     try:
         rating_val = int(rating)
         if not 1 <= rating_val <= 5:
-            print("Invalid rating value. Must be 1-5.")
+            log.warning("Invalid rating value. Must be 1-5.")
             return False
     except ValueError:
-        print("Invalid rating value. Must be an integer.")
+        log.warning("Invalid rating value. Must be an integer.")
         return False
 
     sql = """
@@ -496,12 +690,12 @@ def rate_song(user_id, song_id, rating):
     """
     try:
         with get_db_connection() as conn:
-            with conn.cursor() as curs:
-                curs.execute(sql, (user_id, song_id, rating_val))
-                conn.commit()
-                return True
+            curs = conn.cached_cursor(tuple_rows=True)
+            execute_prepared(curs, 'rate_song', sql, (user_id, song_id, rating_val))
+            conn.commit()
+            return True
     except Exception as e:
-        print(f"Failed to rate song: {e}")
+        log.error("Failed to rate song: %s", e)
         return False
 
 def get_all_users_to_follow(user_id):
@@ -511,19 +705,21 @@ def get_all_users_to_follow(user_id):
     """
     sql = """
         SELECT U.UserID, U.Username, U.Email,
-        CASE WHEN F.Follower IS NOT NULL THEN true ELSE false END as is_following
+        EXISTS(
+            SELECT 1 FROM "follows" F
+            WHERE F.Followee = U.UserID AND F.Follower = %(uid)s
+        ) AS is_following
         FROM "users" U
-        LEFT JOIN "follows" F ON U.UserID = F.Followee AND F.Follower = %s
-        WHERE U.UserID != %s
+        WHERE U.UserID != %(uid)s
         ORDER BY U.Username
     """
     try:
         with get_db_connection() as conn:
             with conn.cursor() as curs:
-                curs.execute(sql, (user_id, user_id))
+                curs.execute(sql, {'uid': user_id})
                 return curs.fetchall()
     except Exception as e:
-        print(f"Failed to get all users: {e}")
+        log.error("Failed to get all users: %s", e)
         return []
 
 def search_users_by_email(user_id, email_term):
@@ -532,20 +728,22 @@ def search_users_by_email(user_id, email_term):
     """
     sql = """
         SELECT U.UserID, U.Username, U.Email,
-        CASE WHEN F.Follower IS NOT NULL THEN true ELSE false END as is_following
+        EXISTS(
+            SELECT 1 FROM "follows" F
+            WHERE F.Followee = U.UserID AND F.Follower = %(uid)s
+        ) AS is_following
         FROM "users" U
-        LEFT JOIN "follows" F ON U.UserID = F.Followee AND F.Follower = %s
-        WHERE U.UserID != %s AND U.Email ILIKE %s
+        WHERE U.UserID != %(uid)s AND U.Email ILIKE %(pattern)s
         ORDER BY U.Username
     """
     search_pattern = f"%{email_term}%"
     try:
         with get_db_connection() as conn:
             with conn.cursor() as curs:
-                curs.execute(sql, (user_id, user_id, search_pattern))
+                curs.execute(sql, {'uid': user_id, 'pattern': search_pattern})
                 return curs.fetchall()
     except Exception as e:
-        print(f"Failed to search users: {e}")
+        log.error("Failed to search users: %s", e)
         return []
 
 def follow_user(follower_id, followee_id):
@@ -559,12 +757,12 @@ def follow_user(follower_id, followee_id):
     sql = 'INSERT INTO "follows" (Follower, Followee) VALUES (%s, %s) ON CONFLICT DO NOTHING'
     try:
         with get_db_connection() as conn:
-            with conn.cursor() as curs:
-                curs.execute(sql, (follower_id, followee_id))
-                conn.commit()
-                return True
+            curs = conn.cached_cursor(tuple_rows=True)
+            execute_prepared(curs, 'follow_user', sql, (follower_id, followee_id))
+            conn.commit()
+            return True
     except Exception as e:
-        print(f"Failed to follow user: {e}")
+        log.error("Failed to follow user: %s", e)
         return False
 
 def unfollow_user(follower_id, followee_id):
@@ -574,12 +772,12 @@ def unfollow_user(follower_id, followee_id):
     sql = 'DELETE FROM "follows" WHERE Follower = %s AND Followee = %s'
     try:
         with get_db_connection() as conn:
-            with conn.cursor() as curs:
-                curs.execute(sql, (follower_id, followee_id))
-                conn.commit()
-                return True
+            curs = conn.cached_cursor(tuple_rows=True)
+            execute_prepared(curs, 'unfollow_user', sql, (follower_id, followee_id))
+            conn.commit()
+            return True
     except Exception as e:
-        print(f"Failed to unfollow user: {e}")
+        log.error("Failed to unfollow user: %s", e)
         return False
 
 def get_top_50_popular_songs():
@@ -607,7 +805,7 @@ def get_top_50_popular_songs():
                 curs.execute(sql)
                 return curs.fetchall()
     except Exception as e:
-        print(f"Error getting top 50 popular songs: {e}")
+        log.error("Error getting top 50 popular songs: %s", e)
         return []
 
 def get_top_50_popular_songs_from_followed_users(user_id):
@@ -635,7 +833,7 @@ def get_top_50_popular_songs_from_followed_users(user_id):
                 curs.execute(sql, (user_id,))
                 return curs.fetchall()
     except Exception as e:
-        print(f"Error getting top 50 popular songs from followed users: {e}")
+        log.error("Error getting top 50 popular songs from followed users: %s", e)
         return []
 
 def get_top_5_genres_of_the_month():
@@ -660,7 +858,7 @@ def get_top_5_genres_of_the_month():
                 curs.execute(sql)
                 return curs.fetchall()
     except Exception as e:
-        print(f"Error getting top 5 genres of the month: {e}")
+        log.error("Error getting top 5 genres of the month: %s", e)
         return []
 
 def get_user_profile_data(user_id):
@@ -699,5 +897,5 @@ def get_user_profile_data(user_id):
                 profile_data['top_artists'] = curs.fetchall()
         return profile_data
     except Exception as e:
-        print(f"Error getting user profile data: {e}")
+        log.error("Error getting user profile data: %s", e)
         return None
\ No newline at end of file
@@ -0,0 +1,37 @@
+'''
+Author: Huy Le (hl9082)
+Co-authors: Jason Ting, Iris Li, Raymond Lee
+Group: 20
+Course: CSCI 320
+Filename: config.py
+Description:
+This module loads the .env file exactly once per process and exposes the
+database credentials. Import it before reading any setting from os.environ.
+It also sets up logging for the process.
+'''
+import os  # Used to read the loaded variables.
+import atexit  # Flushes queued log records at exit.
+import logging  # Process-wide logging setup.
+import queue  # Hands log records from request threads to the writer thread.
+from logging.handlers import QueueHandler, QueueListener  # Writes log records off the request thread.
+from dotenv import load_dotenv, find_dotenv  # Loads variables from a .env file into the environment.
+
+# find_dotenv walks up the directory tree, so do it once here rather than in every module.
+load_dotenv(find_dotenv())
+
+# Database credentials loaded from the .env file.
+CS_USERNAME = os.getenv("CS_USERNAME")
+CS_PASSWORD = os.getenv("CS_PASSWORD")
+DB_NAME = os.getenv("DB_NAME")
+
+# Log records are put on a queue and written to stderr by a background listener,
+# so request threads never wait on the stream. LOG_LEVEL gates what is recorded;
+# messages below it are dropped before any formatting happens.
+_log_queue = queue.SimpleQueue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_log_listener = QueueListener(_log_queue, _log_handler)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), handlers=[QueueHandler(_log_queue)])
+_log_listener.start()
+# Registered before anything else that logs at exit, so it stops (and flushes) last.
+atexit.register(_log_listener.stop)
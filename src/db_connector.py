@@ -13,110 +13,229 @@ It is the single source of truth for all DB connections.
 
 import os  # Used to access environment variables.
 import atexit  # Allows registering functions to be called upon script exit for cleanup.
+import threading  # Guards the one-time tunnel and pool setup.
+import time  # Tracks how long pooled connections have been idle.
 import psycopg2  # The main Python adapter for PostgreSQL.
 from psycopg2.pool import ThreadedConnectionPool  # A connection pool suitable for multi-threaded apps like Flask.
 from psycopg2.extras import DictCursor  # A cursor that returns rows as dictionary-like objects.
+from psycopg2.extensions import connection as BaseConnection  # Base class for our pooled connections.
+from psycopg2.extensions import cursor as BaseCursor  # Plain cursor that returns tuples.
+import re  # Rewrites %s placeholders into $n for PREPARE.
+import logging  # Reports tunnel/pool setup and connection errors.
 from contextlib import contextmanager  # A utility to create context managers for 'with' statements.
 from sshtunnel import SSHTunnelForwarder  # Manages the SSH tunnel to the remote database server.
-from dotenv import load_dotenv, find_dotenv  # Loads variables from a .env file into the environment.
+from config import CS_USERNAME, CS_PASSWORD, DB_NAME  # Database credentials, loaded once from .env.
 
-# Find and load environment variables from .env file
-load_dotenv(find_dotenv())
+log = logging.getLogger(__name__)
 
 # --- Global Variables ---
-# Database credentials loaded from the .env file.
-CS_USERNAME = os.getenv("CS_USERNAME")
-CS_PASSWORD = os.getenv("CS_PASSWORD")
-DB_NAME = os.getenv("DB_NAME")
+
+# Connection pool bounds. DB_POOL_MAX should cover the number of request threads
+# per worker so no request has to wait for a connection.
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Seconds a request waits for a free pooled connection before giving up.
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Connections idle for longer than this are checked with a cheap query before
+# being handed out, so a connection dropped by the server or tunnel is replaced
+# instead of failing the request. Recently used connections skip the check.
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "60"))
 
 # Global placeholders for the SSH tunnel and database pool objects.
-# They are initialized once when the application starts.
+# They are created once per process, on first use, and shared by every request after that.
 server = None
 db_pool = None
+_init_lock = threading.Lock()  # Makes sure concurrent first requests open only one tunnel.
+# ThreadedConnectionPool raises PoolError as soon as it is exhausted; this semaphore
+# makes callers wait for a connection to be returned instead.
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
 
-# This block ensures the tunnel and pool are created only once by the main Flask process.
-# The 'WERKZEUG_RUN_MAIN' check prevents this code from running in the reloader's subprocess.
-if os.environ.get("WERKZEUG_RUN_MAIN") == "true" or os.environ.get("FLASK_ENV") == "production":
-    if not all([CS_USERNAME, CS_PASSWORD, DB_NAME]):
-        raise ConnectionError("Missing database credentials. Please check your .env file.")
+class PreparingConnection(BaseConnection):
+    """
+    A psycopg2 connection that remembers which named statements have already
+    been PREPAREd on its server session (see execute_prepared), when it was
+    last returned to the pool, and a reusable cursor for hot queries.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.last_used = time.monotonic()
+        self._cached_cursors = {}
 
-    print("Configuring SSH tunnel to starbug.cs.rit.edu...")
-    server = SSHTunnelForwarder(
-        ('starbug.cs.rit.edu', 22),
-        ssh_username=CS_USERNAME,
-        ssh_password=CS_PASSWORD,
-        remote_bind_address=('127.0.0.1', 5432)
-    )
+    def cached_cursor(self, tuple_rows=False):
+        """
+        Returns a cursor kept open for the life of this connection, so hot
+        queries reuse one cursor object instead of creating and closing one per call.
+        Only one request holds a pooled connection at a time, so it is never shared.
+        With tuple_rows=True the cursor returns plain tuples instead of DictRows,
+        for hot queries that read a few columns by position.
+        """
+        curs = self._cached_cursors.get(tuple_rows)
+        if curs is None or curs.closed:
+            curs = self.cursor(cursor_factory=BaseCursor) if tuple_rows else self.cursor()
+            self._cached_cursors[tuple_rows] = curs
+        return curs
 
-    try:
-        print("Establishing SSH tunnel...")
-        server.start()
-        print(f"SSH tunnel established on local port {server.local_bind_port}.")
-
-        # The Data Source Name (DSN) is a string containing all connection parameters for psycopg2.
-        dsn = (
-            f"dbname='{DB_NAME}' user='{CS_USERNAME}' password='{CS_PASSWORD}' "
-            f"host='localhost' port='{server.local_bind_port}'"
-        )
+# name -> (PREPARE text, EXECUTE text), built once per process and shared by every connection.
+_statement_text = {}
 
-        print("Creating psycopg2 connection pool...")
-        # A threaded pool is ideal for web apps where each request might be in a different thread.
-        # DictCursor makes row access convenient (e.g., row['column_name']).
-        db_pool = ThreadedConnectionPool(minconn=1, maxconn=10, dsn=dsn, cursor_factory=DictCursor)
-        
-        # Test the connection to ensure the pool is valid before the app starts handling requests.
-        with db_pool.getconn() as conn:
-            print("Database connection successful. Pool is ready.")
-        db_pool.putconn(conn) # Return the connection immediately to the pool.
+def _build_statement_text(name, sql, param_count):
+    """
+    Builds the PREPARE and EXECUTE text for a named statement, rewriting the
+    %s placeholders in sql into $1, $2, ... as PREPARE requires.
+    """
+    counter = iter(range(1, param_count + 1))
+    numbered_sql = re.sub(r'%s', lambda _: f"${next(counter)}", sql)
+    return (f"PREPARE {name} AS {numbered_sql}",
+            f"EXECUTE {name} ({', '.join(['%s'] * param_count)})")
 
-    except Exception as e:
-        print(f"FATAL: Failed to initialize database connection: {e}")
-        if server and server.is_active:
-            server.stop()
-        db_pool = None # Ensure pool is set to None on failure.
+def execute_prepared(curs, name, sql, params):
+    """
+    Runs sql as a server-side prepared statement called `name`.
+    The first call on each pooled connection sends PREPARE; every later call only
+    sends EXECUTE, so the server skips parsing and planning the statement again.
+    sql is written with the usual %s placeholders, in the same order as params.
+    """
+    texts = _statement_text.get(name)
+    if texts is None:
+        texts = _statement_text[name] = _build_statement_text(name, sql, len(params))
+    prepare_sql, execute_sql = texts
+
+    conn = curs.connection
+    if name not in conn.prepared:
+        curs.execute(prepare_sql)
+        conn.prepared.add(name)
+    curs.execute(execute_sql, params)
+
+def _is_alive(conn):
+    """
+    Checks a pooled connection before it is handed out. Connections used in
+    the last DB_POOL_PING_AFTER seconds are trusted; older ones are pinged.
+    """
+    if conn.closed:
+        return False
+    if time.monotonic() - conn.last_used < DB_POOL_PING_AFTER:
+        return True
+    try:
+        with conn.cursor() as curs:
+            curs.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _init_pool():
+    """
+    Opens the SSH tunnel and creates the connection pool, unless another thread already did.
+    Doing this lazily means processes that never touch the database (e.g. the Werkzeug
+    reloader's parent process) never open a tunnel, and every worker opens exactly one.
 
-    def shutdown_hook():
-        """
-        A cleanup function registered with atexit to close resources when the app shuts down.
-        """
-        print("Executing shutdown hook...")
+    Raises:
+        ConnectionError: If credentials are missing or the tunnel/pool could not be set up.
+    """
+    global server, db_pool
+    with _init_lock:
         if db_pool:
-            db_pool.closeall()
-            print("psycopg2 connection pool closed.")
-        if server and server.is_active:
-            server.stop()
-            print("SSH tunnel closed.")
+            return
 
-    atexit.register(shutdown_hook)
+        if not all([CS_USERNAME, CS_PASSWORD, DB_NAME]):
+            raise ConnectionError("Missing database credentials. Please check your .env file.")
+
+        log.info("Configuring SSH tunnel to starbug.cs.rit.edu...")
+        server = SSHTunnelForwarder(
+            ('starbug.cs.rit.edu', 22),
+            ssh_username=CS_USERNAME,
+            ssh_password=CS_PASSWORD,
+            remote_bind_address=('127.0.0.1', 5432)
+        )
+
+        try:
+            log.info("Establishing SSH tunnel...")
+            server.start()
+            log.info("SSH tunnel established on local port %s.", server.local_bind_port)
+
+            # The Data Source Name (DSN) is a string containing all connection parameters for psycopg2.
+            dsn = (
+                f"dbname='{DB_NAME}' user='{CS_USERNAME}' password='{CS_PASSWORD}' "
+                f"host='localhost' port='{server.local_bind_port}'"
+            )
+
+            log.info("Creating psycopg2 connection pool...")
+            # A threaded pool is ideal for web apps where each request might be in a different thread.
+            # DictCursor makes row access convenient (e.g., row['column_name']).
+            # PreparingConnection tracks which prepared statements each connection holds.
+            pool = ThreadedConnectionPool(minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, dsn=dsn,
+                                          connection_factory=PreparingConnection, cursor_factory=DictCursor)
+
+            # Test the connection to ensure the pool is valid before handing it out.
+            with pool.getconn() as conn:
+                log.info("Database connection successful. Pool is ready.")
+            pool.putconn(conn) # Return the connection immediately to the pool.
+            db_pool = pool
+
+        except Exception as e:
+            log.critical("Failed to initialize database connection: %s", e)
+            if server and server.is_active:
+                server.stop()
+            raise ConnectionError("Database pool is not available. Check startup logs for errors.") from e
+
+def shutdown_hook():
+    """
+    A cleanup function registered with atexit to close resources when the app shuts down.
+    """
+    if db_pool:
+        log.info("Executing shutdown hook...")
+        db_pool.closeall()
+        log.info("psycopg2 connection pool closed.")
+    if server and server.is_active:
+        server.stop()
+        log.info("SSH tunnel closed.")
+
+atexit.register(shutdown_hook)
 
 @contextmanager
 def get_db_connection():
     """
     A context manager to safely get a connection from the global pool and ensure it's returned.
+    The SSH tunnel and pool are created on the first call.
     
     Yields:
         conn: A database connection object from the pool.
     
     Raises:
-        ConnectionError: If the database pool was never initialized or failed to initialize.
+        ConnectionError: If the SSH tunnel or database pool failed to initialize,
+            or no connection became free within DB_POOL_TIMEOUT seconds.
         Exception: Re-raises any other exception that occurs while getting a connection.
     """
     if not db_pool:
-        raise ConnectionError("Database pool is not available. Check startup logs for errors.")
+        _init_pool()
+
+    # Wait for a free slot rather than failing when every connection is checked out.
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise ConnectionError("Timed out waiting for a free database connection.")
     
     conn = None
     try:
-        # Get a connection from the pool.
+        # Get a connection from the pool, replacing it if it has gone stale.
         conn = db_pool.getconn()
+        if not _is_alive(conn):
+            db_pool.putconn(conn, close=True)
+            conn = None # Already back in the pool; don't return it twice if the replacement fails
+            conn = db_pool.getconn()
         yield conn
     except Exception as e:
-        print(f"Error getting connection from psycopg2 pool: {e}")
+        log.error("Error getting connection from psycopg2 pool: %s", e)
         raise
     finally:
         # This block ensures the connection is ALWAYS returned to the pool,
-        # even if errors occurred in the 'with' block.
-        if conn:
-            db_pool.putconn(conn)
+        # even if errors occurred in the 'with' block, and that the slot is
+        # released even if returning the connection fails.
+        try:
+            if conn:
+                conn.last_used = time.monotonic()
+                db_pool.putconn(conn)
+        finally:
+            _pool_slots.release()
 
 
 
@@ -0,0 +1,44 @@
+'''
+Author: Huy Le (hl9082)
+Co-authors: Jason Ting, Iris Li, Raymond Lee
+Group: 20
+Course: CSCI 320
+Filename: gunicorn.conf.py
+Description:
+Gunicorn settings for production. Run from the src directory with:
+    gunicorn -c gunicorn.conf.py wsgi:application
+Each worker process opens its own SSH tunnel and connection pool, so keep
+workers * DB_POOL_MAX within the database's connection limit.
+Set GUNICORN_WORKER_CLASS=gevent to serve requests from greenlets instead of
+threads; every handler mostly waits on the database, so a few gevent workers
+can hold many more concurrent requests.
+'''
+import os  # Used to read overrides from the environment.
+import multiprocessing  # Used to size the worker count to the machine.
+
+bind = os.getenv("GUNICORN_BIND", "127.0.0.1:5000")
+
+# Threaded workers by default: while one thread waits on the database or on
+# bcrypt (which releases the GIL), the other threads keep serving requests.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+
+if worker_class == "gevent":
+    # Gunicorn monkey-patches each gevent worker before it loads the app.
+    # Requests beyond DB_POOL_MAX queue for a pooled connection.
+    workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+    worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "500"))
+else:
+    workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+    threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# Marks the workers as production processes (enables the template cache in app.py).
+raw_env = ["FLASK_ENV=production"]
+
+def post_fork(server, worker):
+    """
+    Makes psycopg2 cooperative under gevent. Its C code would otherwise block
+    the whole worker while a query waits on the tunnel.
+    """
+    if worker_class == "gevent":
+        from psycogreen.gevent import patch_psycopg  # Only needed (and installed) for gevent workers.
+        patch_psycopg()
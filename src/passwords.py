@@ -0,0 +1,150 @@
+'''
+Author: Huy Le (hl9082)
+Co-authors: Jason Ting, Iris Li, Raymond Lee
+Group: 20
+Course: CSCI 320
+Filename: passwords.py
+Description:
+This module centralizes password hashing. Every bcrypt call in the application
+goes through here so the work factor is configured (or calibrated) in exactly one place.
+'''
+import os  # Used to read the bcrypt work factor from the environment.
+import config  # Loads .env before BCRYPT_COST is read.
+import hashlib  # Used to key the verification cache without keeping plaintext passwords.
+import threading  # Guards the verification cache.
+import time  # Expires entries in the verification cache and times the cost benchmark.
+import math  # Solves for the bcrypt cost that hits the target hash time.
+from collections import OrderedDict  # Backing store for the LRU verification cache.
+from concurrent.futures import ThreadPoolExecutor  # Runs bcrypt off the request thread.
+import bcrypt  # Native (Rust-backed since 4.0) bcrypt implementation.
+try:
+    from gevent import monkey as gevent_monkey  # Present only when serving with gevent workers.
+except ImportError:
+    gevent_monkey = None
+
+# Shared pool for bcrypt work. bcrypt releases the GIL while hashing, so threads
+# give real parallelism across cores without the fork/pickle cost of processes.
+# Under gevent, threading is patched to greenlets, so a plain pool would run
+# bcrypt on the event loop and stall every request in the worker. Use gevent's
+# own pool of real OS threads instead.
+if gevent_monkey is not None and gevent_monkey.is_module_patched('threading'):
+    from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+    _HASH_POOL = NativeThreadPoolExecutor(max_workers=os.cpu_count())
+else:
+    _HASH_POOL = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="bcrypt")
+
+# Bounds for the calibrated work factor. Each step doubles the hashing time.
+MIN_BCRYPT_COST = 10
+MAX_BCRYPT_COST = 14
+_CALIBRATION_COST = 10
+
+def _calibrate_cost(target_ms):
+    """
+    Times one hash at _CALIBRATION_COST on this machine and picks the cost
+    whose hash takes about target_ms, clamped to [MIN_BCRYPT_COST, MAX_BCRYPT_COST].
+    The benchmark also warms bcrypt up: the shared library is paged in and the
+    first pool thread is started before the first real login.
+    """
+    salt = bcrypt.gensalt(rounds=_CALIBRATION_COST)
+    start = time.perf_counter()
+    _HASH_POOL.submit(bcrypt.hashpw, b'calibration', salt).result()
+    measured_ms = max((time.perf_counter() - start) * 1000, 0.001)
+    cost = _CALIBRATION_COST + round(math.log2(target_ms / measured_ms))
+    return min(max(cost, MIN_BCRYPT_COST), MAX_BCRYPT_COST)
+
+# The bcrypt work factor. BCRYPT_COST pins it explicitly; otherwise it is
+# calibrated at startup so one hash takes about BCRYPT_TARGET_MS on this server.
+if os.getenv("BCRYPT_COST"):
+    BCRYPT_COST = int(os.getenv("BCRYPT_COST"))
+else:
+    BCRYPT_COST = _calibrate_cost(float(os.getenv("BCRYPT_TARGET_MS", "250")))
+
+# Hash that unknown usernames are checked against, so a failed login costs one
+# bcrypt run whether or not the user exists (no username enumeration by timing).
+_DUMMY_HASH = _HASH_POOL.submit(
+    bcrypt.hashpw, b'not-a-real-password', bcrypt.gensalt(rounds=BCRYPT_COST)
+).result()
+
+# Small LRU of recent successful verifications, keyed by a digest of the
+# (password, hash) pair, so rapid re-authentication with the same password is
+# not re-hashed every time. The stored hash carries a per-user salt, so the key
+# is already unique per user. Entries expire after VERIFY_CACHE_TTL seconds.
+# Failed checks are never cached, so every wrong guess still pays full bcrypt
+# cost. The cache is per process and never shared with clients.
+VERIFY_CACHE_SIZE = 4096
+VERIFY_CACHE_TTL = 60
+_verify_cache = OrderedDict() # key -> expires_at
+_verify_cache_lock = threading.Lock()
+
+def _salt_and_hash(password_bytes):
+    """
+    Generates a fresh salt and hashes with it. Runs on the hash pool, so the
+    request thread does neither the salt's urandom read nor the hashing.
+    """
+    return bcrypt.hashpw(password_bytes, bcrypt.gensalt(rounds=BCRYPT_COST, prefix=b'2b'))
+
+def hash_password(password):
+    """
+    Hashes a plaintext password with bcrypt using the configured work factor.
+
+    Returns:
+        The bcrypt hash as a string, ready to be stored in the "users" table.
+    """
+    hashed = _HASH_POOL.submit(_salt_and_hash, password.encode('utf-8')).result()
+    return hashed.decode('utf-8')
+
+def hash_passwords(plaintexts):
+    """
+    Hashes many plaintext passwords at once, spread across the hash pool's
+    threads (e.g. for a bulk user import).
+
+    Returns:
+        The bcrypt hashes as strings, in the same order as plaintexts.
+    """
+    hashed = _HASH_POOL.map(_salt_and_hash, [p.encode('utf-8') for p in plaintexts])
+    return [h.decode('utf-8') for h in hashed]
+
+# Version prefixes a stored bcrypt hash can start with.
+_BCRYPT_PREFIXES = (b'$2a$', b'$2b$', b'$2y$')
+
+def is_bcrypt_hash(stored):
+    """
+    Checks if a stored password value (as bytes) is a bcrypt hash rather than
+    a legacy plaintext password from before hashing was introduced.
+    """
+    return len(stored) == 60 and stored[:4] in _BCRYPT_PREFIXES
+
+def check_password(password, hashed):
+    """
+    Checks a plaintext password against a stored bcrypt hash, given as bytes.
+    When hashed is None (unknown user) the dummy hash is checked instead,
+    so both cases take the same time.
+
+    Returns:
+        True if the password matches the hash, False otherwise.
+    """
+    password_bytes = password.encode('utf-8')
+    hashed_bytes = hashed if hashed is not None else _DUMMY_HASH
+    key = hashlib.sha256(password_bytes + b'\0' + hashed_bytes).digest()
+
+    with _verify_cache_lock:
+        cached = _verify_cache.get(key)
+        if cached is not None:
+            if cached > time.monotonic():
+                _verify_cache.move_to_end(key)
+                return True
+            del _verify_cache[key]
+
+    try:
+        # Run on the pool so the request thread (or greenlet) isn't held by bcrypt.
+        matched = _HASH_POOL.submit(bcrypt.checkpw, password_bytes, hashed_bytes).result() and hashed is not None
+    except ValueError:
+        # The stored value is not a valid bcrypt hash.
+        matched = False
+
+    if matched:
+        with _verify_cache_lock:
+            _verify_cache[key] = time.monotonic() + VERIFY_CACHE_TTL
+            if len(_verify_cache) > VERIFY_CACHE_SIZE:
+                _verify_cache.popitem(last=False)
+    return matched
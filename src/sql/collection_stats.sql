@@ -0,0 +1,76 @@
+-- Author: Huy Le (hl9082)
+-- Co-authors: Jason Ting, Iris Li, Raymond Lee
+-- Group: 20
+-- Course: CSCI 320
+-- Filename: collection_stats.sql
+-- Description:
+-- Keeps "collection".NumberOfSongs and "collection".Length in step with
+-- "consists_of", so every writer (the app, the data loaders, psql) updates
+-- them and get_user_collections only reads one row per collection.
+-- The triggers fire once per statement and read the changed rows from a
+-- transition table, so adding a whole album updates each collection once.
+-- Deleting a song cascades to "consists_of" after the song row is gone, when
+-- its length can no longer be joined, so a row trigger on "song" takes the
+-- song out of its collections' stats first.
+-- Safe to re-run; the backfill recomputes the stats from scratch.
+-- Usage: psql -d p320_20 -f src/sql/collection_stats.sql
+
+CREATE OR REPLACE FUNCTION collection_stats_track() RETURNS trigger AS $$
+DECLARE
+    direction INTEGER := CASE TG_OP WHEN 'INSERT' THEN 1 ELSE -1 END;
+BEGIN
+    UPDATE "collection" C
+    SET
+        NumberOfSongs = C.NumberOfSongs + direction * D.SongCount,
+        Length = C.Length + direction * D.TotalLength
+    FROM (
+        SELECT CH.UserID, CH.Title, COUNT(*) AS SongCount, COALESCE(SUM(S.Length), 0) AS TotalLength
+        FROM changed_songs CH
+        JOIN "song" S ON S.SongID = CH.SongID
+        GROUP BY CH.UserID, CH.Title
+    ) D
+    WHERE C.UserID = D.UserID AND C.Title = D.Title;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS consists_of_added_trigger ON "consists_of";
+CREATE TRIGGER consists_of_added_trigger
+AFTER INSERT ON "consists_of"
+REFERENCING NEW TABLE AS changed_songs
+FOR EACH STATEMENT EXECUTE FUNCTION collection_stats_track();
+
+DROP TRIGGER IF EXISTS consists_of_removed_trigger ON "consists_of";
+CREATE TRIGGER consists_of_removed_trigger
+AFTER DELETE ON "consists_of"
+REFERENCING OLD TABLE AS changed_songs
+FOR EACH STATEMENT EXECUTE FUNCTION collection_stats_track();
+
+CREATE OR REPLACE FUNCTION collection_stats_song_removed() RETURNS trigger AS $$
+BEGIN
+    UPDATE "collection" C
+    SET
+        NumberOfSongs = C.NumberOfSongs - 1,
+        Length = C.Length - OLD.Length
+    FROM "consists_of" CO
+    WHERE CO.SongID = OLD.SongID AND C.UserID = CO.UserID AND C.Title = CO.Title;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS song_removed_stats_trigger ON "song";
+CREATE TRIGGER song_removed_stats_trigger
+BEFORE DELETE ON "song"
+FOR EACH ROW EXECUTE FUNCTION collection_stats_song_removed();
+
+-- Backfill from the existing collection contents.
+BEGIN;
+LOCK TABLE "consists_of" IN SHARE MODE;
+UPDATE "collection" C
+SET (NumberOfSongs, Length) = (
+    SELECT COUNT(*), COALESCE(SUM(S.Length), 0)
+    FROM "consists_of" CO
+    JOIN "song" S ON S.SongID = CO.SongID
+    WHERE CO.UserID = C.UserID AND CO.Title = C.Title
+);
+COMMIT;
@@ -0,0 +1,41 @@
+-- Author: Huy Le (hl9082)
+-- Co-authors: Jason Ting, Iris Li, Raymond Lee
+-- Group: 20
+-- Course: CSCI 320
+-- Filename: indexes.sql
+-- Description:
+-- Indexes that back the queries in backend.py. Safe to re-run.
+-- Usage: psql -d p320_20 -f src/sql/indexes.sql
+
+-- search_songs: ORDER BY on the sortable song columns + LIMIT can walk the index
+-- instead of sorting every matching row.
+CREATE INDEX IF NOT EXISTS song_title_idx ON "song" (Title);
+CREATE INDEX IF NOT EXISTS song_releasedate_idx ON "song" (ReleaseDate);
+
+-- search_songs: the search box matches each title or name with ILIKE '%term%',
+-- which a B-tree can't serve. Trigram GIN indexes let those unanchored patterns
+-- use an index scan.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS song_title_trgm_idx ON "song" USING gin (Title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS artist_name_trgm_idx ON "artist" USING gin (Name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS album_name_trgm_idx ON "album" USING gin (Name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS genres_genretype_trgm_idx ON "genres" USING gin (GenreType gin_trgm_ops);
+
+-- get_user_collections: WHERE UserID = ... ORDER BY Title reading NumberOfSongs
+-- and Length. Including the two stats columns turns it into an index-only scan
+-- that is already in order (no heap fetch, no sort).
+CREATE INDEX IF NOT EXISTS collection_user_title_covering_idx ON "collection" (UserID, Title) INCLUDE (NumberOfSongs, Length);
+ANALYZE "collection";
+
+-- get_collection_details, play_collection and the song add/remove statements:
+-- every "consists_of" lookup is by (UserID, Title). Including SongID allows
+-- index-only scans.
+CREATE INDEX IF NOT EXISTS consists_of_user_title_idx ON "consists_of" (UserID, Title) INCLUDE (SongID);
+
+-- get_all_users_to_follow / search_users_by_email: the per-user is_following
+-- flag is EXISTS(SELECT 1 FROM "follows" F WHERE F.Followee = U.UserID AND
+-- F.Follower = ...), one index probe on both key columns per listed user.
+CREATE INDEX IF NOT EXISTS follows_followee_follower_idx ON "follows" (Followee, Follower);
+
+-- get_collection_details: LEFT JOIN "rates" R ON R.SongID = ... AND R.UserID = ...
+CREATE INDEX IF NOT EXISTS rates_user_song_idx ON "rates" (UserID, SongID);
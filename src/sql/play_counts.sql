@@ -0,0 +1,49 @@
+-- Author: Huy Le (hl9082)
+-- Co-authors: Jason Ting, Iris Li, Raymond Lee
+-- Group: 20
+-- Course: CSCI 320
+-- Filename: play_counts.sql
+-- Description:
+-- Per-user listen counts, kept up to date by a trigger on "plays" so that
+-- search_songs can join one row per song instead of running COUNT(*) over
+-- "plays" for every result. Safe to re-run; the backfill rebuilds the counts.
+-- Usage: psql -d p320_20 -f src/sql/play_counts.sql
+
+CREATE TABLE IF NOT EXISTS "user_song_plays" (
+    UserID INTEGER NOT NULL,
+    SongID INTEGER NOT NULL,
+    PlayCount INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (UserID, SongID)
+);
+
+CREATE OR REPLACE FUNCTION user_song_plays_track() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO "user_song_plays" (UserID, SongID, PlayCount)
+        VALUES (NEW.UserID, NEW.SongID, 1)
+        ON CONFLICT (UserID, SongID)
+        DO UPDATE SET PlayCount = "user_song_plays".PlayCount + 1;
+        RETURN NEW;
+    ELSE
+        UPDATE "user_song_plays"
+        SET PlayCount = PlayCount - 1
+        WHERE UserID = OLD.UserID AND SongID = OLD.SongID;
+        RETURN OLD;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS plays_count_trigger ON "plays";
+CREATE TRIGGER plays_count_trigger
+AFTER INSERT OR DELETE ON "plays"
+FOR EACH ROW EXECUTE FUNCTION user_song_plays_track();
+
+-- Backfill from the existing plays.
+BEGIN;
+LOCK TABLE "plays" IN SHARE MODE;
+TRUNCATE "user_song_plays";
+INSERT INTO "user_song_plays" (UserID, SongID, PlayCount)
+SELECT UserID, SongID, COUNT(*)
+FROM "plays"
+GROUP BY UserID, SongID;
+COMMIT;
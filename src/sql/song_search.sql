@@ -0,0 +1,74 @@
+-- Author: Huy Le (hl9082)
+-- Co-authors: Jason Ting, Iris Li, Raymond Lee
+-- Group: 20
+-- Course: CSCI 320
+-- Filename: song_search.sql
+-- Description:
+-- One pre-joined row per song with its artist, album and genre lists, so
+-- search_songs and get_collection_details can show the lists without
+-- aggregating the bridge tables for every result. Songs, their columns and the
+-- search filters are always read from the live tables, so a song loaded since
+-- the last refresh is still found; it just shows empty lists until then.
+-- The view is refreshed every 15 minutes by pg_cron when that extension is
+-- installed; otherwise schedule the same command from cron (see README.md).
+-- Safe to re-run.
+-- Usage: psql -d p320_20 -f src/sql/song_search.sql
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS "song_search" AS
+SELECT
+    S.SongID,
+    S.Title,
+    S.Length,
+    S.ReleaseDate,
+    AR.artist_list,
+    AB.album_list,
+    AB.AlbumID,
+    GE.genre_list
+FROM "song" S
+CROSS JOIN LATERAL (
+    SELECT COALESCE(STRING_AGG(DISTINCT A.Name, ',' ORDER BY A.Name), '') AS artist_list
+    FROM "performs" P
+    JOIN "artist" A ON P.ArtistID = A.ArtistID
+    WHERE P.SongID = S.SongID
+) AR
+CROSS JOIN LATERAL (
+    SELECT
+        COALESCE(STRING_AGG(DISTINCT AL.Name, ',' ORDER BY AL.Name), '') AS album_list,
+        MIN(AL.AlbumID) AS AlbumID
+    FROM "contains" C
+    JOIN "album" AL ON C.AlbumID = AL.AlbumID
+    WHERE C.SongID = S.SongID
+) AB
+CROSS JOIN LATERAL (
+    SELECT COALESCE(STRING_AGG(DISTINCT G.GenreType, ',' ORDER BY G.GenreType), '') AS genre_list
+    FROM "has" H
+    JOIN "genres" G ON H.GenreID = G.GenreID
+    WHERE H.SongID = S.SongID
+) GE
+WITH DATA;
+
+-- REFRESH ... CONCURRENTLY needs a unique index, and the SongID joins use it.
+CREATE UNIQUE INDEX IF NOT EXISTS song_search_songid_idx ON "song_search" (SongID);
+
+-- Searching and sorting now run on the live tables (see indexes.sql), so the
+-- view's own search and sort indexes are no longer used.
+DROP INDEX IF EXISTS song_search_title_idx;
+DROP INDEX IF EXISTS song_search_releasedate_idx;
+DROP INDEX IF EXISTS song_search_artist_list_idx;
+DROP INDEX IF EXISTS song_search_title_trgm_idx;
+DROP INDEX IF EXISTS song_search_artist_list_trgm_idx;
+DROP INDEX IF EXISTS song_search_album_list_trgm_idx;
+DROP INDEX IF EXISTS song_search_genre_list_trgm_idx;
+
+ANALYZE "song_search";
+
+-- Keep the lists current without a manual step. cron.schedule replaces the
+-- job of the same name, so re-running this script doesn't add a second one.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+        PERFORM cron.schedule('refresh-song-search', '*/15 * * * *',
+                              'REFRESH MATERIALIZED VIEW CONCURRENTLY "song_search"');
+    END IF;
+END;
+$$;
@@ -0,0 +1,11 @@
+'''
+Author: Huy Le (hl9082)
+Co-authors: Jason Ting, Iris Li, Raymond Lee
+Group: 20
+Course: CSCI 320
+Filename: wsgi.py
+Description:
+WSGI entry point for running the application under a production server
+such as Gunicorn (see gunicorn.conf.py).
+'''
+from app import app as application  # The Flask app, under the name WSGI servers look for.